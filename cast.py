@@ -1,3 +1,12 @@
+import re
+from datetime import datetime
+from datetime import timedelta
+
+
+# ISO 8601 as used by EXT-X-PROGRAM-DATE-TIME, e.g. 2015-03-03T16:02:51.347+00:00
+ISO_DATE_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})'
+                         r'(?:\.(\d+))?(Z|[+-]\d{2}:?\d{2})?$')
+
 
 def attr_name(key):
     return key.strip().replace('#EXT-X-','').replace('-','_').lower()
@@ -74,3 +83,20 @@ def my_cast(val):
 
     return val
 
+
+
+def my_datetime(a):
+    # returns a naive datetime in UTC
+    m = ISO_DATE_RE.match(a.strip())
+    if not m:
+        raise ValueError
+    year, month, day, hour, minute, sec, frac, tz = m.groups()
+    usec = int((frac or '0')[:6].ljust(6, '0'))
+    ts = datetime(int(year), int(month), int(day), int(hour), int(minute),
+                  int(sec), usec)
+    if tz and tz != 'Z':
+        sign = 1 if tz[0] == '+' else -1
+        tz = tz[1:].replace(':', '')
+        offset = timedelta(hours=int(tz[:2]), minutes=int(tz[2:]))
+        ts = ts - sign * offset
+    return ts
@@ -0,0 +1,83 @@
+import random
+import bisect
+import logging
+
+
+ZIPF_EXPONENT = 1.0
+
+LIVE = 'live'
+VOD = 'vod'
+
+
+class Catalog(object):
+  # Catalog file, one stream per line:
+  #   url[,weight[,live|vod]]
+  # Lines are in popularity order: with 'zipf' popularity the n-th stream
+  # gets weight 1/n^s, with 'weights' the weight column is used instead.
+  def __init__(self, path, popularity='zipf', zipf_s=ZIPF_EXPONENT,
+               live_ratio=None):
+    self._path = path
+    self._popularity = popularity
+    self._zipf_s = zipf_s
+    self._live_ratio = live_ratio
+    self.urls = []
+    self.types = []
+    # (stream ids, cumulative weights) of all, live and vod streams
+    self._all = ([], [])
+    self._live = ([], [])
+    self._vod = ([], [])
+    self.load()
+
+  def __len__(self):
+    # streams that can be picked
+    return len(self._all[0])
+
+  def load(self):
+    f = open(self._path, 'r')
+    for l in f:
+      l = l.strip()
+      if not l or l.startswith('#'):
+        continue
+      parts = l.split(',')
+      weight = 1.0
+      stream_type = VOD
+      try:
+        if len(parts) > 1 and parts[1]:
+          weight = float(parts[1])
+        if len(parts) > 2 and parts[2].strip().lower() == LIVE:
+          stream_type = LIVE
+      except ValueError:
+        logging.error('Bad catalog line, skipping: %s' % l)
+        continue
+      stream_id = len(self.urls)
+      if self._popularity == 'zipf':
+        weight = 1.0 / (stream_id + 1) ** self._zipf_s
+      self.urls.append(parts[0].strip())
+      self.types.append(stream_type)
+      if weight <= 0:
+        continue
+      self.add(self._all, stream_id, weight)
+      self.add(self._live if stream_type == LIVE else self._vod,
+               stream_id, weight)
+    f.close()
+
+  def add(self, pool, stream_id, weight):
+    ids, cumulative = pool
+    ids.append(stream_id)
+    cumulative.append(weight + (cumulative[-1] if cumulative else 0.0))
+
+  def choose(self, pool):
+    ids, cumulative = pool
+    idx = bisect.bisect_right(cumulative, random.random() * cumulative[-1])
+    return ids[min(idx, len(ids) - 1)]
+
+  def pick(self):
+    # returns (stream id, url)
+    pool = self._all
+    if self._live_ratio is not None and self._live[0] and self._vod[0]:
+      if random.random() < self._live_ratio:
+        pool = self._live
+      else:
+        pool = self._vod
+    stream_id = self.choose(pool)
+    return stream_id, self.urls[stream_id]
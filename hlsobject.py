@@ -2,21 +2,33 @@ import urllib2
 import socket
 import urlparse
 import time
+from datetime import timedelta
 
 import  cast
 import hlserror
+import selfprofile
 
 
 DOWNLOAD_TIMEOUT = 6
 
+# resolver.Resolver used for host overrides, None to use plain urllib2
+resolver = None
+
 
 class HLSObject(object):
-    def request(self, name=None):
+    def request(self, name=None, pin_key=None):
         if name is None:
             name = self.url # I want to log full url
         self.content_len = 0
+        self.edge = ''
         try:
-          r = urllib2.urlopen(self.url, timeout=DOWNLOAD_TIMEOUT)
+          if resolver is None:
+            r = urllib2.urlopen(self.url, timeout=DOWNLOAD_TIMEOUT)
+          else:
+            try:
+              r = resolver.urlopen(self.url, DOWNLOAD_TIMEOUT, pin_key)
+            finally:
+              self.edge = resolver.last_edge()
         except (urllib2.HTTPError, urllib2.URLError) as e:
           self.bad_url = True
         except (socket.timeout, Exception) as e:
@@ -32,8 +44,8 @@ class HLSObject(object):
           return r
         return None
 
-    def download(self):
-      r = self.request()
+    def download(self, pin_key=None):
+      r = self.request(pin_key=pin_key)
       if r:
         self.parse(r.read())
         return True
@@ -83,8 +95,10 @@ class MediaPlaylist(HLSObject):
             for k in attributes:
                 setattr(self,k,attributes[k])
 
+    @selfprofile.timed('MediaPlaylist.parse')
     def parse(self,manifest):
         ms_counter = None
+        program_date_time = None
         lines = manifest.split('\n')
         assert(lines[0].startswith('#EXTM3U'))
         for i,line in enumerate(lines):
@@ -106,8 +120,20 @@ class MediaPlaylist(HLSObject):
                                                                   url,
                                                                   attr,
                                                                   self,
-                                                                  ms_counter))
+                                                                  ms_counter,
+                                                                  program_date_time))
                 ms_counter += 1
+                # fragments without their own tag follow the previous one
+                if program_date_time is not None:
+                    duration = attr[0] if isinstance(attr, list) else attr
+                    program_date_time += timedelta(seconds=duration)
+
+            elif line.startswith('#EXT-X-PROGRAM-DATE-TIME'):
+                key,val = line.split(':', 1)
+                try:
+                    program_date_time = cast.my_datetime(val)
+                except ValueError:
+                    program_date_time = None
 
             elif line.startswith('#EXT-X-ENDLIST'):
               self.endlist = True
@@ -135,6 +161,16 @@ class MediaPlaylist(HLSObject):
         except IndexError:
             return -1
 
+    def live_edge_distance(self, msq):
+        # seconds of media between the start of fragment msq and the newest
+        # available fragment's end
+        dist = 0.0
+        for f in reversed(self.media_fragments):
+            if f.media_sequence < msq:
+                break
+            dist += f.duration
+        return dist
+
     def get_media_fragment(self, msq):
         idx = msq - self.first_media_sequence()
         idx = max(idx, 0)
@@ -147,17 +183,19 @@ class MediaPlaylist(HLSObject):
         return self.media_fragments[idx]
 
 class MediaFragment(HLSObject):
-    def __init__(self,name,url,attributes,parent=None, seq=None):
+    def __init__(self,name,url,attributes,parent=None, seq=None,
+                 program_date_time=None):
         self.url=url
         self.name=name
         self.parent = parent
         self.duration = attributes[0] # only attrib??
         self.media_sequence = seq
+        self.program_date_time = program_date_time # naive UTC datetime
 
-    def download(self):
+    def download(self, pin_key=None):
         #assert(str(self.media_sequence) in self.name) # HACK
         name = 'Segment ({url})'.format(url=self.parent.url)
-        r = self.request(name=name)
+        r = self.request(name=name, pin_key=pin_key)
         if r:
             return True
         else:
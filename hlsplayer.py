@@ -1,6 +1,10 @@
 import os, sys, signal, time
 import argparse
 import logging
+import random
+import urlparse
+import Queue
+import collections
 
 from threading import Thread, Lock
 from datetime import datetime
@@ -11,6 +15,11 @@ import socket
 import hlsobject
 import hlserror
 import plotresults
+import resultstore
+import sessiontrace
+import catalog
+import resolver
+import selfprofile
 
 
 NUM_DOWNLOAD_RETRIES = 5
@@ -18,8 +27,18 @@ DOWNLOAD_TIMEOUT = 6
 MANIFEST_TIMEOUT = 6
 BUFFER_FILL_LEVEL = 25
 
+# capacity search defaults
+CAPACITY_STEP = 10
+CAPACITY_STEP_DUR = 60
+SLO_REBUF_RATIO = 1.0     # perc95 rebuffering ratio (%) within a step
+SLO_SEG_LATENCY = 2000.0  # perc95 segment download time (ms)
+SLO_ERROR_RATE = 1.0      # failed downloads (%)
 
-CSV_HEADER="time,type,content_length,download_time,buffer,rebuf_count,rebuf_dur,rebuf_ratio,error_count,player_id,url"
+# trace replay defaults
+REPLAY_WORKERS = 50       # also the cap on in-flight replay requests
+
+
+CSV_HEADER="time,type,content_length,download_time,buffer,rebuf_count,rebuf_dur,rebuf_ratio,error_count,live_edge,latency,player_id,stream,edge,url"
 
 
 # flag to stop execution
@@ -28,9 +47,10 @@ should_exit = False
 
 
 class Player(Thread):
-  def __init__(self, dur, dst_dir, url):
+  def __init__(self, dur, dst_dir, url, stream_id=0):
     Thread.__init__(self)
     self._url = url
+    self._stream_id = stream_id
     self._dur = dur
     self._last_sequence = -1
     self._last_pl = None
@@ -43,7 +63,17 @@ class Player(Thread):
     self._rebuffer_duration = 0.0
     self._rebuf_ratio = 0.0
     self._download_error_count = 0
+    self._live_edge = -1.0  # logged once, -1 when unknown
+    self._latency = None    # logged once, as an empty field when unknown
     self._logfile = None
+    self._stop = False
+    # counters for the current capacity search window
+    self._window_lock = Lock()
+    self._window_seg_times = []
+    self._window_requests = 0
+    self._window_errors = 0
+    self._window_rebuf_dur = 0.0
+    self._window_start = datetime.now()
     self.open_log_file(dst_dir)
 
   def open_log_file(self, dst_dir):
@@ -64,22 +94,62 @@ class Player(Thread):
     ts_start = datetime.now()
     for i in range(NUM_DOWNLOAD_RETRIES):
       self.master_playlist = hlsobject.MasterPlaylist('master', self._url)
-      r = self.master_playlist.download()
+      r = self.master_playlist.download(self._player_id)
       if r is True:
         break
     return ts_start, datetime.now()
 
   def download(self, obj):
     ts_start = datetime.now()
+    r = False
     for i in range(NUM_DOWNLOAD_RETRIES):
-      r = obj.download()
+      if self.should_stop():
+        break
+      r = obj.download(self._player_id)
       if r is True:
         break
+    with self._window_lock:
+      self._window_requests += 1
+      if r is not True:
+        self._download_error_count += 1
+        self._window_errors += 1
     return ts_start, datetime.now(), r
 
+  def stop(self):
+    self._stop = True
+
+  def close(self):
+    self._logfile.close()
+    if hlsobject.resolver is not None:
+      hlsobject.resolver.unpin(self._player_id)
+
+  def should_stop(self):
+    return should_exit or self._stop
+
+  def collect_window(self):
+    # Returns the stats gathered since the previous call:
+    #   (rebuf ratio %, segment download times in ms, requests, errors)
+    ts = datetime.now()
+    with self._window_lock:
+      delta = ts - self._window_start
+      delta_sec = delta.seconds + delta.microseconds / 1000000.0
+      rebuf = self._rebuffer_duration - self._window_rebuf_dur
+      stats = (100.0 * rebuf / delta_sec if delta_sec > 0 else 0.0,
+               self._window_seg_times,
+               self._window_requests,
+               self._window_errors)
+      self._window_seg_times = []
+      self._window_requests = 0
+      self._window_errors = 0
+      self._window_rebuf_dur = self._rebuffer_duration
+      self._window_start = ts
+    return stats
+
+  @selfprofile.timed('logging')
   def log_msg(self, msg):
     self._logfile.write("%s\n" % msg)
 
+  @selfprofile.timed('Player.update_player')
   def update_player(self, new_seg, ts, seglen=0):
     if not self._playing:
       if not new_seg:
@@ -110,10 +180,32 @@ class Player(Thread):
       self._rebuf_ratio = self._rebuffer_duration / dur_sec
     self._last_update_time = ts
 
-  def log_file_download(self, f_type, url, ts_start, ts_end, content_len):
+  def update_live_stats(self, playlist, media_seq, frag=None):
+    # Live only: distance (sec) from media_seq to the newest available
+    # segment and, when the fragment carries a PROGRAM-DATE-TIME, the
+    # estimated glass-to-glass latency of that fragment
+    if playlist.endlist:
+      return
+    if media_seq > playlist.last_media_sequence():
+      self._live_edge = 0.0
+    else:
+      self._live_edge = playlist.live_edge_distance(media_seq)
+    if frag is not None and frag.program_date_time is not None:
+      # the fragment starts playing once the rest of the buffer drains
+      play_ts = datetime.utcnow() + timedelta(
+                            seconds=max(self._buffer - frag.duration, 0.0))
+      delta = play_ts - frag.program_date_time
+      # may be negative when the packager and generator clocks are skewed
+      self._latency = delta.total_seconds()
+
+  def log_file_download(self, f_type, url, ts_start, ts_end, content_len,
+                        edge=''):
     delta = ts_end - ts_start
     delta_sec = delta.seconds + (delta.microseconds / 1000000.0) 
-    self.log_msg('%s,%s,%d,%f,%f,%d,%f,%f,%d,%d,%s' % (
+    if f_type == 'seg':
+      with self._window_lock:
+        self._window_seg_times.append(delta_sec * 1000.0)
+    self.log_msg('%s,%s,%d,%f,%f,%d,%f,%f,%d,%f,%s,%d,%d,%s,%s' % (
                                                 str(ts_start),
                                                 f_type,
                                                 content_len,
@@ -123,11 +215,26 @@ class Player(Thread):
                                                 self._rebuffer_duration,
                                                 self._rebuf_ratio * 100,
                                                 self._download_error_count,
+                                                self._live_edge,
+                                                '' if self._latency is None
+                                                  else '%f' % self._latency,
                                                 self._player_id,
+                                                self._stream_id,
+                                                edge,
                                                 url
                                                 ))
+    # both belong to the request they were measured for only
+    self._latency = None
+    self._live_edge = -1.0
 
   def run(self):
+    try:
+      self.play()
+    finally:
+      # flush the log before plotresults reads it
+      self.close()
+
+  def play(self):
     # download initial playlist
     ts = datetime.now()
     self._last_update_time = ts
@@ -145,7 +252,8 @@ class Player(Thread):
     if r is False:
       logging.error('Player %d: Bad manifest, exiting...' % self._player_id)
       return
-    self.log_file_download('manifest', playlist.url, ts_start, ts_end, playlist.content_len)
+    self.log_file_download('manifest', playlist.url, ts_start, ts_end,
+                           playlist.content_len, playlist.edge)
     playlist_download_time = ts_end
 
     if playlist.endlist:        # VOD
@@ -153,14 +261,17 @@ class Player(Thread):
     else: # live video
       media_seq = max(playlist.last_media_sequence() - 2, playlist.first_media_sequence())
 
-    while not should_exit and dur_sec < self._dur:
+    while not self.should_stop() and dur_sec < self._dur:
 
       if media_seq <= playlist.last_media_sequence():
         try:
           a = playlist.get_media_fragment(media_seq)
           ts_start, ts_end, r = self.download(a)
           self.update_player(r, ts_end, a.duration)
-          self.log_file_download('seg', a.url, ts_start, ts_end, a.content_len)
+          if r:
+            self.update_live_stats(playlist, media_seq, a)
+          self.log_file_download('seg', a.url, ts_start, ts_end, a.content_len,
+                                 a.edge)
         except hlserror.MissedFragment as e:
           pass
         media_seq += 1
@@ -174,8 +285,8 @@ class Player(Thread):
         playlist_age = datetime.now() - playlist_download_time
         playlist_age_sec = playlist_age.seconds + playlist_age.microseconds / 1000000.0
         while playlist_age_sec < a.duration:
-          time.sleep(1)
-          if should_exit:
+          selfprofile.sleep(1)
+          if self.should_stop():
             break
           playlist_age = datetime.now() - playlist_download_time
           playlist_age_sec = playlist_age.seconds + playlist_age.microseconds / 1000000.0
@@ -184,8 +295,10 @@ class Player(Thread):
         if playlist.last_media_sequence() >= media_seq:
           playlist_download_time = ts_end
         self.update_player(False, ts_end)
+        # how far behind the newest available segment this player drifted
+        self.update_live_stats(playlist, media_seq)
         self.log_file_download('manifest', playlist.url, ts_start, ts_end,
-            playlist.content_len)
+            playlist.content_len, playlist.edge)
 
       # Check if we are done playing a VOD video
       if playlist.endlist and media_seq > playlist.last_media_sequence():
@@ -193,8 +306,8 @@ class Player(Thread):
     
       # Player will sleep as long as the buffer is above a certain threshold
       while self._buffer > BUFFER_FILL_LEVEL:
-        time.sleep(1)
-        if should_exit:
+        selfprofile.sleep(1)
+        if self.should_stop():
           break
         self.update_player(False, datetime.now())
 
@@ -203,11 +316,211 @@ class Player(Thread):
       dur_sec = dur.seconds + dur.microseconds / 1000000.0
 
 
+class ReplaySession(Player):
+  # A player driven by the events of a recorded session instead of run().
+  # Any replay worker may handle an event, but only one at a time handles
+  # the events of a session, in schedule order. Playlist paths of the trace
+  # are resolved against the origin.
+  def __init__(self, dst_dir, origin):
+    Player.__init__(self, 0, dst_dir, origin)
+    self._playlist = None
+    self._media_seq = -1
+    # events waiting for a worker, guarded by the replay lock
+    self._pending = collections.deque()
+    self._busy = False
+
+  def open_log_file(self, dst_dir):
+    # There are far more live sessions than open files allowed, so the rows
+    # are kept until the worker that logged them appends them to the file
+    Player.open_log_file(self, dst_dir)
+    self._logfile.close()
+    self._log_rows = []
+
+  @selfprofile.timed('logging')
+  def log_msg(self, msg):
+    self._log_rows.append(msg)
+
+  def flush_log(self):
+    if self._log_rows:
+      f = open(self._logfile.name, 'a')
+      f.write(''.join('%s\n' % msg for msg in self._log_rows))
+      f.close()
+      self._log_rows = []
+
+  def close(self):
+    self.flush_log()
+    Player.close(self)
+
+  def handle(self, op, arg):
+    if op == sessiontrace.MASTER:
+      self.get_master(arg)
+    elif op == sessiontrace.JOIN:
+      self.start_session(arg)
+    elif op == sessiontrace.STOP:
+      self.close()
+    elif self._playlist is None:
+      return  # join failed
+    elif op == sessiontrace.MANIFEST:
+      self.refresh_playlist()
+    elif op == sessiontrace.SEGMENT:
+      self.next_segment()
+    elif op == sessiontrace.SEEK:
+      self._media_seq = max(self._media_seq + int(arg),
+                            self._playlist.first_media_sequence())
+
+  def get_master(self, path):
+    # only fetched for its request, the recorded variant is used
+    master = hlsobject.MasterPlaylist('master',
+                                      urlparse.urljoin(self._url, path))
+    ts_start, ts_end, r = self.download(master)
+    self.log_file_download('manifest', master.url, ts_start, ts_end,
+                           master.content_len, master.edge)
+
+  def start_session(self, path):
+    playlist = hlsobject.MediaPlaylist('media',
+                                       urlparse.urljoin(self._url, path))
+    ts_start, ts_end, r = self.download(playlist)
+    self.log_file_download('manifest', playlist.url, ts_start, ts_end,
+                           playlist.content_len, playlist.edge)
+    if r is False:
+      logging.error('Player %d: Bad manifest' % self._player_id)
+      return
+    self._playlist = playlist
+    if playlist.endlist:        # VOD
+      self._media_seq = playlist.first_media_sequence()
+    else: # live video
+      self._media_seq = max(playlist.last_media_sequence() - 2,
+                            playlist.first_media_sequence())
+
+  def refresh_playlist(self):
+    ts_start, ts_end, r = self.download(self._playlist)
+    self.update_player(False, ts_end)
+    self.update_live_stats(self._playlist, self._media_seq)
+    self.log_file_download('manifest', self._playlist.url, ts_start, ts_end,
+                           self._playlist.content_len, self._playlist.edge)
+
+  def next_segment(self):
+    if self._media_seq > self._playlist.last_media_sequence():
+      # past the live edge; the recorded playlist refreshes bring the
+      # session back, an extra refresh here would not be in the trace
+      return
+    try:
+      a = self._playlist.get_media_fragment(self._media_seq)
+      ts_start, ts_end, r = self.download(a)
+      self.update_player(r, ts_end, a.duration)
+      if r:
+        self.update_live_stats(self._playlist, self._media_seq, a)
+      self.log_file_download('seg', a.url, ts_start, ts_end, a.content_len,
+                             a.edge)
+    except hlserror.MissedFragment as e:
+      pass
+    self._media_seq += 1
+
+
+def replay_worker(ready, lock):
+  # Handles one event of a ready session, then puts the session back at the
+  # end of the queue if more events arrived, so that a slow session does
+  # not hold on to the worker
+  while True:
+    session = ready.get()
+    if session is None:
+      break
+    with lock:
+      op, arg = session._pending.popleft()
+    try:
+      if not should_exit or op == sessiontrace.STOP:
+        session.handle(op, arg)
+      session.flush_log()
+    except Exception as e:
+      logging.error('Player %d: replay of %s failed: %s' % (
+                                              session._player_id, op, e))
+    with lock:
+      if session._pending:
+        ready.put(session)
+      else:
+        session._busy = False
+    ready.task_done()
+
+
+def replay(schedule_path, origin, speed, num_workers, dst_dir):
+  # The schedule is streamed from disk, only live sessions are kept around.
+  # Events are dispatched on time whatever the workers are doing; at most
+  # num_workers requests are in flight and the rest wait in their session.
+  ready = Queue.Queue()
+  lock = Lock()
+  workers = [Thread(target=replay_worker, args=(ready, lock))
+             for i in range(num_workers)]
+  for w in workers:
+    w.start()
+
+  sessions = {}
+  start = time.time()
+  lag = 0.0
+  try:
+    for t, session_id, op, arg in sessiontrace.read_schedule(schedule_path):
+      if should_exit:
+        break
+      delay = start + t / speed - time.time()
+      while delay > 0 and not should_exit:
+        time.sleep(min(delay, 1.0))
+        delay = start + t / speed - time.time()
+      lag = max(lag, -delay)
+      selfprofile.record_lag(-delay)
+
+      session = sessions.get(session_id)
+      if session is None:
+        if op not in (sessiontrace.MASTER, sessiontrace.JOIN):
+          continue
+        session = ReplaySession(dst_dir, origin)
+        sessions[session_id] = session
+      elif op == sessiontrace.STOP:
+        del sessions[session_id]
+      with lock:
+        session._pending.append((op, arg))
+        if not session._busy:
+          session._busy = True
+          ready.put(session)
+  finally:
+    # the workers are not daemons and must be let go even after an error;
+    # Queue.join() would not let Ctrl-C through
+    while ready.unfinished_tasks:
+      time.sleep(0.5)
+    for w in workers:
+      ready.put(None)
+    for w in workers:
+      w.join()
+    for session in sessions.values():
+      session.close()
+  logging.info('Replay finished, max scheduling lag %.3f sec' % lag)
+
+
 def parse_params():
   parser = argparse.ArgumentParser(description='Simulate HLS player')
   parser.add_argument('--url', metavar='url', type=str, default="", dest='url',
                        help='URL of master manifest (or playlist)')
 
+  parser.add_argument('--catalog', dest='catalog', default="", type=str,
+                      help='File with one master URL per line '
+                      '(url[,weight[,live|vod]]), used instead of --url')
+
+  parser.add_argument('--popularity', dest='popularity', default='zipf',
+                      choices=['zipf', 'weights'],
+                      help='Assign catalog streams by Zipf rank or by the '
+                      'catalog weights')
+
+  parser.add_argument('--zipf-s', dest='zipf_s', default=catalog.ZIPF_EXPONENT,
+                      type=float, help='Exponent of the Zipf popularity')
+
+  parser.add_argument('--live-ratio', dest='live_ratio', default=None,
+                      type=float, help='Share of players assigned to live '
+                      'catalog streams (default: follow popularity)')
+
+  parser.add_argument('--resolve', dest='resolve', action='append',
+                      default=[], metavar='HOST=ADDR[,ADDR...][/pin]',
+                      help='Send requests for HOST to the given edge '
+                      'address(es), round-robin per request or pinned per '
+                      'player with /pin. Can be repeated')
+
   parser.add_argument('-d', '--duration', dest='dur', default=60, type=int,
                       help='duration of the streaming session')
 
@@ -219,6 +532,49 @@ def parse_params():
 
   parser.add_argument('--dst', dest='dst_dir', default="./", type=str,
                       help='path where log files will be saved')
+
+  parser.add_argument('--capacity', dest='capacity', action='store_true',
+                      help='Capacity search: start with NUM_PLAYERS and keep '
+                      'adding players until an SLO is crossed (ignores -d)')
+
+  parser.add_argument('--step', dest='step', default=CAPACITY_STEP, type=int,
+                      help='Players added per capacity search step')
+
+  parser.add_argument('--min-step', dest='min_step', default=0, type=int,
+                      help='After a breach, back off and halve the step down '
+                      'to MIN_STEP (default 0: stop at the first breach)')
+
+  parser.add_argument('--step-dur', dest='step_dur', default=CAPACITY_STEP_DUR,
+                      type=int, help='Seconds each capacity search step is '
+                      'measured for')
+
+  parser.add_argument('--max-players', dest='max_players', default=0, type=int,
+                      help='Upper bound for capacity search (0: no bound)')
+
+  parser.add_argument('--slo-rebuf', dest='slo_rebuf', default=SLO_REBUF_RATIO,
+                      type=float, help='Max perc95 rebuffering ratio (%%)')
+
+  parser.add_argument('--slo-latency', dest='slo_latency',
+                      default=SLO_SEG_LATENCY, type=float,
+                      help='Max perc95 segment download time (ms)')
+
+  parser.add_argument('--slo-errors', dest='slo_errors', default=SLO_ERROR_RATE,
+                      type=float, help='Max failed download rate (%%)')
+
+  parser.add_argument('--replay', dest='schedule', default="", type=str,
+                      help='Replay a session schedule built with '
+                      'sessiontrace.py against the origin given by --url')
+
+  parser.add_argument('--speed', dest='speed', default=1.0, type=float,
+                      help='Time compression factor of the replay')
+
+  parser.add_argument('--workers', dest='workers', default=REPLAY_WORKERS,
+                      type=int, help='Number of replay worker threads, which is '
+                      'also the maximum of requests in flight')
+
+  parser.add_argument('--no-self-profile', dest='self_profile',
+                      action='store_false',
+                      help='Do not profile the load generator itself')
   return parser
 
 
@@ -244,6 +600,146 @@ def create_experiment_dir(dst_dir):
   return dst_dir # return base directory if failed to create a new one
 
 
+def start_players(players, count, rate, dur, dst_dir, pick_stream):
+  for i in range(count):
+    if should_exit:
+      break
+    stream_id, url = pick_stream()
+    p = Player(dur, dst_dir, url, stream_id)
+    players.append(p)
+    p.start()
+    selfprofile.sleep(1.0 / rate)
+
+
+def wait(seconds):
+  end = time.time() + seconds
+  while not should_exit and time.time() < end:
+    time.sleep(1)
+
+
+def percentile(vals, perc):
+  if not vals:
+    return 0.0
+  vals = sorted(vals)
+  return vals[min(int(perc * len(vals)), len(vals) - 1)]
+
+
+def measure_step(players, slo):
+  rebuf = []
+  seg_times = []
+  requests = 0
+  errors = 0
+  for p in players:
+    r, t, n, e = p.collect_window()
+    rebuf.append(r)
+    seg_times.extend(t)
+    requests += n
+    errors += e
+  metrics = {'rebuf_ratio' : percentile(rebuf, 0.95),
+             'seg_latency' : percentile(seg_times, 0.95),
+             'error_rate' : 100.0 * errors / max(requests, 1),
+             'requests' : requests}
+  breached = [k for k in sorted(slo) if metrics[k] > slo[k]]
+  # an empty window would pass every SLO
+  if not seg_times:
+    breached.append('no_data')
+  return metrics, breached
+
+
+def capacity_search(args, dst_dir, pick_stream):
+  slo = {'rebuf_ratio' : args.slo_rebuf,
+         'seg_latency' : args.slo_latency,
+         'error_rate' : args.slo_errors}
+  step = args.step
+  target = args.num_players
+  last_good = 0
+  players = []
+  stopped = []
+  steps = []
+  degraded = {}
+
+  while not should_exit:
+    if args.max_players and target > args.max_players:
+      break
+    # VOD players may have finished, top up to the target concurrency
+    players = [p for p in players if p.isAlive()]
+    logging.info('Capacity search step %d: %d player(s)' % (len(steps) + 1,
+                                                            target))
+    start_players(players, target - len(players), args.rate, float('inf'),
+                  dst_dir, pick_stream)
+    # discard whatever was collected while ramping up
+    for p in players:
+      p.collect_window()
+    window_start = time.time()
+    wait(args.step_dur)
+    if should_exit:
+      break
+    metrics, breached = measure_step(players, slo)
+    # an overloaded generator says nothing about the origin
+    if selfprofile.saturated_since(window_start):
+      breached.append('generator')
+    steps.append((target, metrics, breached))
+    if not breached:
+      last_good = target
+      target += step
+      continue
+
+    for k in breached:
+      degraded.setdefault(k, len(steps))
+    # without --min-step the search ends at the first breach
+    if 'generator' in breached or 'no_data' in breached or \
+       args.min_step == 0 or step <= args.min_step or step <= 1:
+      break
+    # back off: drop the players added by this step and refine the step
+    for p in players[last_good:]:
+      p.stop()
+    stopped.extend(players[last_good:])
+    players = players[:last_good]
+    step = max(step / 2, args.min_step, 1)
+    target = last_good + step
+
+  for p in players:
+    p.stop()
+  for p in players + stopped:
+    p.join()
+  write_capacity_report(dst_dir, steps, slo, last_good, degraded)
+
+
+def write_capacity_report(dst_dir, steps, slo, last_good, degraded):
+  lines = ['step,players,requests,rebuf_ratio_p95,seg_latency_p95,'
+           'error_rate,breached']
+  for i, (n, metrics, breached) in enumerate(steps):
+    lines.append('%d,%d,%d,%f,%f,%f,%s' % (i + 1, n,
+                                           metrics['requests'],
+                                           metrics['rebuf_ratio'],
+                                           metrics['seg_latency'],
+                                           metrics['error_rate'],
+                                           ' '.join(breached)))
+  lines.append('')
+  lines.append('max sustainable concurrency: %d' % last_good)
+  for k in sorted(slo):
+    if k in degraded:
+      n = steps[degraded[k] - 1][0]
+      lines.append('%s (slo %.2f) degraded at step %d (%d players)' % (
+                                                  k, slo[k], degraded[k], n))
+    else:
+      lines.append('%s (slo %.2f) never degraded' % (k, slo[k]))
+  if 'generator' in degraded:
+    lines.append('load generator saturated at step %d (%d players), '
+                 'add generator capacity before trusting larger steps' % (
+                 degraded['generator'], steps[degraded['generator'] - 1][0]))
+  if 'no_data' in degraded:
+    lines.append('no segment downloaded during step %d (%d players), the '
+                 'search was stopped there' % (
+                 degraded['no_data'], steps[degraded['no_data'] - 1][0]))
+  # not a .csv so that plotresults does not mistake it for a player log
+  f = open(os.path.join(dst_dir, 'capacity.txt'), 'w')
+  for l in lines:
+    logging.info(l)
+    f.write('%s\n' % l)
+  f.close()
+
+
 
 def main(argv):
   logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
@@ -252,15 +748,28 @@ def main(argv):
   args = parser.parse_args()
   bad_args = False
 
-  if not args.url:
+  if not args.url and not args.catalog:
     logging.error('Empty url ... exiting')
     bad_args = True
+  elif args.catalog and args.schedule:
+    logging.error('Catalog cannot be used with replay, exiting...')
+    bad_args = True
+  elif args.live_ratio is not None and not 0 <= args.live_ratio <= 1:
+    logging.error('Live ratio must be between 0 and 1, exiting...')
+    bad_args = True
   elif args.num_players <= 0:
     logging.error('Number of players myst be positive, exiting...')
     bad_args = True
   elif args.rate <= 0:
     logging.error('Rate of clients must be positive, exiting...')
     bad_args = True
+  elif args.capacity and (args.step <= 0 or args.step_dur <= 0 or
+                          args.min_step < 0):
+    logging.error('Capacity search step and duration must be positive, exiting...')
+    bad_args = True
+  elif args.schedule and (args.speed <= 0 or args.workers <= 0):
+    logging.error('Replay speed and workers must be positive, exiting...')
+    bad_args = True
     
   if bad_args:
     parser.print_help()
@@ -275,16 +784,42 @@ def main(argv):
   if not os.path.exists(dst_dir):
     logging.error('Destination path %s does not exist, you should create the path, exiting!' % dst_dir)
     return
+
+  if args.catalog:
+    streams = catalog.Catalog(args.catalog, args.popularity, args.zipf_s,
+                              args.live_ratio)
+    if len(streams) == 0:
+      logging.error('Empty catalog %s, exiting!' % args.catalog)
+      return
+    logging.info('Loaded %d stream(s) from %s' % (len(streams), args.catalog))
+    pick_stream = streams.pick
+  else:
+    pick_stream = lambda: (0, url)
+
+  if args.resolve:
+    try:
+      hlsobject.resolver = resolver.Resolver(args.resolve)
+    except (ValueError, socket.error) as e:
+      logging.error('%s, exiting!' % e)
+      return
+
   # Create a subdirectory for this experiment
   dst_dir = create_experiment_dir(dst_dir)
+  if args.self_profile:
+    selfprofile.start()
+
+  if args.capacity:
+    capacity_search(args, dst_dir, pick_stream)
+    return dst_dir
+
+  if args.schedule:
+    logging.info("Replaying %s ..." % args.schedule)
+    replay(args.schedule, url, args.speed, args.workers, dst_dir)
+    return dst_dir
 
   logging.info("Starting HLS player(s) ...")
   players = []
-  for i in range(n):
-    p = Player(dur, dst_dir, url)
-    players.append(p)
-    p.start()
-    time.sleep(1.0 / rate)
+  start_players(players, n, rate, dur, dst_dir, pick_stream)
 
   logging.info("Started all player(s) ...")
 
@@ -309,5 +844,10 @@ for sig in [signal.SIGTERM, signal.SIGINT]:
 
 path = main(sys.argv)
 
-plotresults.plot_results(path)
+if path:
+  selfprofile.stop(path)
+  plotresults.plot_results(path)
+  # keep every experiment of dst_dir in one indexed store for later queries
+  resultstore.ingest(os.path.join(os.path.dirname(os.path.normpath(path)),
+                                  resultstore.RESULTS_DB), path)
 
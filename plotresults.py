@@ -1,12 +1,29 @@
 import os
 import sys
+import cgi
 import glob
+import math
+import base64
+import random
+import multiprocessing
 from datetime import datetime
 from datetime import timedelta
-import pylab
+import matplotlib
+matplotlib.use('Agg')  # never needs a display
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import selfprofile
 
 
 BIN_SIZE = 10
+# Long runs use larger bins so that memory stays bounded
+MAX_BUCKETS = 4000
+# Series are decimated to this many points before plotting
+MAX_POINTS = 1000
+# Samples kept per bucket (and per stream) to compute percentiles
+RESERVOIR_SIZE = 101
+STREAM_RESERVOIR_SIZE = 32
 
 MANIFEST_TYPE = 1
 SEGMENT_TYPE = 2
@@ -19,6 +36,8 @@ class PlayerStats(object):
     self.start_time = None
     self.end_time = None
     self.bitrate = None
+    self.stream = None
+    self.player_id = None
     self._time = []
     self._ftype = []
     self._content_length = []
@@ -28,6 +47,10 @@ class PlayerStats(object):
     self._rebuf_dur = []
     self._rebuf_ratio = []
     self._error_count = []
+    self._live_edge = []
+    self._latency = []
+    self._edge = []
+    self._url = []
 
   def get_time(self):
     return self._time
@@ -41,6 +64,30 @@ class PlayerStats(object):
   def get_download_time(self):
     return self._download_time
 
+  def get_error_count(self):
+    return self._error_count
+
+  def get_buffer(self):
+    return self._buffer
+
+  def get_content_length(self):
+    return self._content_length
+
+  def get_url(self):
+    return self._url
+
+  def get_edge(self):
+    return self._edge
+
+  def get_type(self):
+    return self._ftype
+
+  def get_live_edge(self):
+    return self._live_edge
+
+  def get_latency(self):
+    return self._latency
+
   def read_header(self):
     f = open(self._fpath, 'r')
     l = f.readline().strip()
@@ -49,7 +96,27 @@ class PlayerStats(object):
       return []
     return l.split(',')
 
+  def read_time_range(self):
+    # time of the first and last log lines, without parsing the whole file
+    header = self.read_header()
+    if not header:
+      return None, None
+    f = open(self._fpath, 'rb')
+    f.readline()
+    first = self.parse_line(f.readline().strip(), header).get('time')
+    f.seek(0, 2)
+    f.seek(max(0, f.tell() - 4096))
+    last = None
+    for l in reversed(f.read().splitlines()):
+      last = self.parse_line(l.strip(), header).get('time')
+      if last is not None:
+        break
+    f.close()
+    return first, last
+
   def try_get_bitrate(self, url):
+    if '?' not in url:
+      return None
     query = url.split('?')[1]
     query_parts = query.split('&')
     for part in query_parts:
@@ -82,6 +149,10 @@ class PlayerStats(object):
         self.start_time = vals['time']
       if self.bitrate is None:
         self.bitrate = self.try_get_bitrate(vals['url'])
+      if self.stream is None:
+        self.stream = vals.get('stream', 0)
+      if self.player_id is None:
+        self.player_id = vals.get('player_id')
       self.end_time = vals['time']
       self._time.append(vals['time'])
       self._ftype.append(vals['type'])
@@ -92,6 +163,11 @@ class PlayerStats(object):
       self._rebuf_dur.append(vals['rebuf_dur'])
       self._rebuf_ratio.append(vals['rebuf_ratio'])
       self._error_count.append(vals['error_count'])
+      # older logs do not have live latency columns
+      self._live_edge.append(vals.get('live_edge', -1.0))
+      self._latency.append(vals.get('latency'))
+      self._edge.append(vals.get('edge', ''))
+      self._url.append(vals['url'])
 
   def cast_int(self, v):
     return int(v)
@@ -99,6 +175,12 @@ class PlayerStats(object):
   def cast_float(self, v):
     return float(v)
 
+  def cast_optional_float(self, v):
+    # empty when not measured
+    if not v:
+      return None
+    return float(v)
+
   def cast_type(self, v):
     if v == 'manifest':
       return MANIFEST_TYPE
@@ -108,6 +190,9 @@ class PlayerStats(object):
 
   def cast_time(self, v):
     # Expected format: 2015-03-03 16:02:51.347423
+    # str(datetime) drops the fraction when it is 0
+    if '.' not in v:
+      return datetime.strptime(v, '%Y-%m-%d %H:%M:%S')
     return datetime.strptime(v, '%Y-%m-%d %H:%M:%S.%f') 
 
   def parse_line(self, l, header):
@@ -120,7 +205,11 @@ class PlayerStats(object):
                     'rebuf_count' : self.cast_int,
                     'rebuf_dur' : self.cast_float,
                     'rebuf_ratio' : self.cast_float,
-                    'error_count' : self.cast_int}
+                    'error_count' : self.cast_int,
+                    'stream' : self.cast_int,
+                    'player_id' : self.cast_int,
+                    'live_edge' : self.cast_float,
+                    'latency' : self.cast_optional_float}
     try:
       parts = l.split(',')
       if len(parts) != len(header): # bad line!!
@@ -140,140 +229,423 @@ class PlayerStats(object):
   def update_relative_time(self, ts):
     for i in range(len(self._time)):
       delta = self._time[i] - ts
-      delta_sec = delta.seconds + delta.microseconds / 1000000.0
-      self._time[i] = delta_sec
+      self._time[i] = delta.total_seconds()
 
 
-def parse_all_files(path):
-  files = glob.glob(os.path.join(path, '*.csv'))
-  all_players = []  
-  start_time = None
-  end_time = None
-
-  for f in files:
-    p = PlayerStats(f)
-    p.parse()
-    all_players.append(p)
+class Reservoir(object):
+  # Uniform sample of at most size values, used for percentiles
+  def __init__(self, size=RESERVOIR_SIZE):
+    self._size = size
+    self.count = 0
+    self.samples = []
 
-    # update start_time, end_time
-    if start_time is None:
-      start_time = p.start_time
+  def add(self, v):
+    self.count += 1
+    if len(self.samples) < self._size:
+      self.samples.append(v)
     else:
-      if p.start_time < start_time:
-        start_time = p.start_time
+      j = random.randint(0, self.count - 1)
+      if j < self._size:
+        self.samples[j] = v
+
+  def percentiles(self, percs):
+    vals = sorted(self.samples)
+    if not vals:
+      return [0] * len(percs)
+    return [vals[min(int(p * len(vals)), len(vals) - 1)] for p in percs]
+
+
+def bucket_percentiles(buckets, percs):
+  # one series per percentile, empty buckets are reported as 0
+  series = [[0] * len(buckets) for p in percs]
+  for i, r in enumerate(buckets):
+    if r is None:
+      continue
+    for j, v in enumerate(r.percentiles(percs)):
+      series[j][i] = v
+  return series
+
+
+def add_sample(buckets, idx, v):
+  if buckets[idx] is None:
+    buckets[idx] = Reservoir()
+  buckets[idx].add(v)
+
+
+class EdgeStats(object):
+  def __init__(self, bucket_count):
+    self.requests = 0
+    self.errors = 0
+    self.download_time = Reservoir()
+    self.download_times = [None] * bucket_count
+    self.errors_t = [0] * bucket_count
+
+
+class StreamStats(object):
+  def __init__(self):
+    self.players = 0
+    self.requests = 0
+    self.errors = 0
+    self.seg_times = Reservoir(STREAM_RESERVOIR_SIZE)
+    self.rebuf = Reservoir(STREAM_RESERVOIR_SIZE)
+
+
+class RunStats(object):
+  # Per bucket aggregates of a whole run. Players are added one at a time,
+  # memory depends on the number of buckets, not on the number of requests.
+  def __init__(self, start_time, end_time):
+    duration_sec = (end_time - start_time).total_seconds()
+    self.start_time = start_time
+    self.duration = duration_sec
+    self.bin_size = max(BIN_SIZE, int(math.ceil(duration_sec / MAX_BUCKETS)))
+    self.bucket_count = 1 + int(duration_sec / self.bin_size)
+    n = self.bucket_count
+    self.players = 0
+    self.requests = 0
+    self.errors = 0
+    # +1/-1 at the first/last full bucket of each player
+    self._player_diff = [0] * (n + 1)
+    self._bitrate_diff = [0] * (n + 1)
+    self.request_count = [0] * n
+    self.rebuf_ratio = [None] * n
+    self.latency = [None] * n
+    self.live_edge = [None] * n
+    self.seg_time = Reservoir()
+    self.final_rebuf = Reservoir()
+    self.edges = {}
+    self.streams = {}
+
+  def bucket(self, t):
+    return min(max(int(t / self.bin_size), 0), self.bucket_count - 1)
+
+  def add_player(self, p):
+    p.update_relative_time(self.start_time)
+    time = p.get_time()
+    if not time:
+      return
+    self.players += 1
+    self.requests += len(time)
+    self.errors += p.get_error_count()[-1]
+    self.final_rebuf.add(p.get_rebuf_ratio()[-1])
+
+    # buckets the player was active for as a whole
+    first = int(time[0] / self.bin_size) + 1
+    last = int(math.ceil(time[-1] / self.bin_size)) - 2
+    if first <= last:
+      self._player_diff[first] += 1
+      self._player_diff[last + 1] -= 1
+      if p.bitrate is not None:
+        self._bitrate_diff[first] += p.bitrate
+        self._bitrate_diff[last + 1] -= p.bitrate
+
+    stream = self.streams.get(p.stream)
+    if stream is None:
+      stream = self.streams[p.stream] = StreamStats()
+    stream.players += 1
+    stream.requests += len(time)
+    stream.errors += p.get_error_count()[-1]
+    stream.rebuf.add(p.get_rebuf_ratio()[-1])
+
+    ftype = p.get_type()
+    rebuf = p.get_rebuf_ratio()
+    latency = p.get_latency()
+    live_edge = p.get_live_edge()
+    edges = p.get_edge()
+    errors = p.get_error_count()
+    download_time = p.get_download_time()
+    prev_errors = 0
+    for i in xrange(len(time)):
+      b = self.bucket(time[i])
+      self.request_count[b] += 1
+      add_sample(self.rebuf_ratio, b, rebuf[i])
+      if ftype[i] == SEGMENT_TYPE and latency[i] is not None:
+        add_sample(self.latency, b, latency[i])
+      if live_edge[i] >= 0:
+        add_sample(self.live_edge, b, live_edge[i])
+
+      edge = edges[i] or 'default'
+      e = self.edges.get(edge)
+      if e is None:
+        e = self.edges[edge] = EdgeStats(self.bucket_count)
+      e.requests += 1
+      if errors[i] > prev_errors:
+        e.errors += 1
+        e.errors_t[b] += 1
+      else:
+        e.download_time.add(download_time[i])
+        add_sample(e.download_times, b, download_time[i])
+        if ftype[i] == SEGMENT_TYPE:
+          self.seg_time.add(download_time[i])
+          stream.seg_times.add(download_time[i])
+      prev_errors = errors[i]
+
+  def cumulate(self, diff):
+    vals = []
+    total = 0
+    for d in diff[:-1]:
+      total += d
+      vals.append(total)
+    return vals
 
-    if end_time is None:
-      end_time = p.end_time
-    else:
-      if p.end_time > end_time:
-        end_time = p.end_time
-  return all_players, start_time, end_time 
-
-
-def plot_num_players(player_count, path):
-  t = pylab.arange(BIN_SIZE/2, len(player_count) * BIN_SIZE, BIN_SIZE)
-  pylab.plot(t, player_count, linewidth=3.0)
-  pylab.axis([0, max(t)+BIN_SIZE/2, 0, 1.1 * max(player_count)])
-  pylab.title('Number of active players')
-  pylab.xlabel('Time (s)')
-  pylab.ylabel('Number of players')
-  pylab.savefig(os.path.join(path, 'num_player.png'))
-  pylab.close()
-
-
-def plot_avg_bitrate(bitrates, path):
-  t = pylab.arange(BIN_SIZE/2, len(bitrates) * BIN_SIZE, BIN_SIZE)
-  pylab.plot(t, bitrates, linewidth=3.0)
-  pylab.axis([0, max(t)+BIN_SIZE/2, 0, 100 + 1.1 * max(bitrates)])
-  pylab.title('Average bitrate')
-  pylab.xlabel('Time (s)')
-  pylab.ylabel('Average video bitrate (Kbps)')
-  pylab.savefig(os.path.join(path, 'avg_bitrate.png'))
-  pylab.close()
-
-
-def compute_rebuf_stats(rebuf_ratio):
-  median = [0] * len(rebuf_ratio)
-  perc95 = [0] * len(rebuf_ratio)
-  for i in range(len(rebuf_ratio)):
-    rebuf_ratio[i].sort()
-    median[i] = rebuf_ratio[i][ len(rebuf_ratio[i])/2 ]
-    perc95[i] = rebuf_ratio[i][ int(0.95 * len(rebuf_ratio[i])) ]
-  return median, perc95
-
-
-def plot_buf_ratio(rebuf_ratio, path):
-  median, perc95 = compute_rebuf_stats(rebuf_ratio)
-  t = pylab.arange(BIN_SIZE/2, len(rebuf_ratio) * BIN_SIZE, BIN_SIZE)
-  pylab.plot(t, perc95, linewidth=3.0, label='Perc95')
-  pylab.plot(t, median, linewidth=3.0, label='Median')
-  pylab.axis([0, max(t)+BIN_SIZE/2, 0, 0.5+ 1.1 * max(perc95)])
-  pylab.title('Rebuffering ratio (%) {median, perc95}')
-  pylab.xlabel('Time (s)')
-  pylab.ylabel('Rebuffering ratio (%)')
-  legend = pylab.legend(loc='upper center', shadow=True)
-  pylab.savefig(os.path.join(path, 'rebuf_ratio.png'))
-  pylab.close()
-
-
-def plot_summary(rebuf_ratio, bitrates, player_count, path):
-  median, perc95 = compute_rebuf_stats(rebuf_ratio)
-  t = pylab.arange(BIN_SIZE/2, len(rebuf_ratio) * BIN_SIZE, BIN_SIZE)
-  pylab.figure(1)
-  pylab.subplot(311)
-  pylab.plot(t, player_count, linewidth=3.0)
-  pylab.axis([0, max(t)+BIN_SIZE/2, 0, 1.1 * max(player_count)])
-  pylab.ylabel('Number of players')
-
-  pylab.subplot(312)
-  pylab.plot(t, bitrates, linewidth=3.0)
-  pylab.axis([0, max(t)+BIN_SIZE/2, 0, 100 + 1.1 * max(bitrates)])
-  pylab.ylabel('Average bitrate (Kbps)')
-
-  pylab.subplot(313)
-  pylab.plot(t, perc95, linewidth=3.0, label='Perc95')
-  pylab.plot(t, median, linewidth=3.0, label='Median')
-  pylab.axis([0, max(t)+BIN_SIZE/2, 0, 0.5 + 1.1 * max(perc95)])
-  pylab.xlabel('Time (s)')
-  pylab.ylabel('Rebuffering ratio (%)')
-  legend = pylab.legend(loc='upper center', shadow=True)
-  pylab.savefig(os.path.join(path, 'summary.png'))
-  pylab.close()
+  def player_count(self):
+    return self.cumulate(self._player_diff)
 
+  def bitrates(self):
+    return [b / max(1, n) for b, n in zip(self.cumulate(self._bitrate_diff),
+                                          self.player_count())]
 
-def plot_results(path):
-  all_players, start_time, end_time = parse_all_files(path)
-  duration = end_time - start_time
-  duration_sec = duration.seconds + duration.microseconds / 1000000.0
-  bucket_count = 1 + int(duration_sec / BIN_SIZE)
-
-  request_count = [0] * bucket_count
-  player_count = [0] * bucket_count
-  rebuf_ratio = [[] for i in range(bucket_count)]
-  bitrates = [0] * bucket_count
-
-  for p in all_players:
-    p.update_relative_time(start_time)
-    time = p.get_time()
-    this_rebuf = p.get_rebuf_ratio()
+  def times(self):
+    return [self.bin_size / 2.0 + i * self.bin_size
+            for i in range(self.bucket_count)]
 
-    for i in range(bucket_count):
-      if time[0] < i * BIN_SIZE and time[-1] > (i+1) * BIN_SIZE:
-        player_count[i] += 1
-        if p.bitrate is not None:
-          bitrates[i] += p.bitrate
 
-    for i in range(len(time)):
-      this_bucket = int(time[i] / BIN_SIZE)
-      request_count[this_bucket] += 1
-      rebuf_ratio[this_bucket].append(this_rebuf[i])
+def scan_files(files):
+  start_time = None
+  end_time = None
+  for f in files:
+    first, last = PlayerStats(f).read_time_range()
+    if first is None:
+      continue
+    if start_time is None or first < start_time:
+      start_time = first
+    if end_time is None or last > end_time:
+      end_time = last
+  return start_time, end_time
 
-  # compute average bitrate
-  for i in range(len(bitrates)):
-    bitrates[i] = bitrates[i] / max(1, player_count[i])
 
-  plot_num_players(player_count, path)
-  plot_avg_bitrate(bitrates, path)
-  plot_buf_ratio(rebuf_ratio, path)
-  plot_summary(rebuf_ratio, bitrates, player_count, path)
+def parse_all_files(path):
+  # Players are parsed one at a time and folded into the run aggregates
+  files = glob.glob(os.path.join(path, '*.csv'))
+  start_time, end_time = scan_files(files)
+  if start_time is None:
+    return None
+  stats = RunStats(start_time, end_time)
+  for f in files:
+    p = PlayerStats(f)
+    p.parse()
+    stats.add_player(p)
+  return stats
+
+
+def decimate(t, y, max_points=MAX_POINTS):
+  # keeps the min and max of every chunk so that spikes survive
+  if len(y) <= max_points:
+    return t, y
+  chunk = int(math.ceil(len(y) / (max_points / 2.0)))
+  dt = []
+  dy = []
+  for start in xrange(0, len(y), chunk):
+    ys = y[start:start + chunk]
+    lo = min(xrange(len(ys)), key=ys.__getitem__)
+    hi = max(xrange(len(ys)), key=ys.__getitem__)
+    for j in sorted(set([lo, hi])):
+      dt.append(t[start + j])
+      dy.append(ys[j])
+  return dt, dy
+
+
+def render_figure(spec):
+  # spec: {'path', 'title', 'xmax', 'panels': [{'ylabel', 'ymax', 'legend',
+  #        'series': [(label, t, y)]}]}
+  panels = spec['panels']
+  fig = Figure(figsize=(8, 6 if len(panels) < 3 else 9))
+  FigureCanvasAgg(fig)
+  for i, panel in enumerate(panels):
+    ax = fig.add_subplot(len(panels), 1, i + 1)
+    for label, t, y in panel['series']:
+      t, y = decimate(t, y)
+      ax.plot(t, y, linewidth=panel.get('linewidth', 3.0), label=label)
+    ax.axis([0, spec['xmax'], panel.get('ymin', 0), panel['ymax']])
+    ax.set_ylabel(panel['ylabel'])
+    if i == 0 and spec.get('title'):
+      ax.set_title(spec['title'])
+    if i == len(panels) - 1:
+      ax.set_xlabel('Time (s)')
+    if panel.get('legend'):
+      ax.legend(loc='upper center', shadow=True)
+  fig.savefig(spec['path'])
+  return spec['path']
+
+
+def render_all(specs):
+  # figures are independent, render them in parallel
+  if len(specs) < 2:
+    map(render_figure, specs)
+    return
+  pool = multiprocessing.Pool(min(len(specs), multiprocessing.cpu_count()))
+  try:
+    pool.map(render_figure, specs)
+  finally:
+    pool.close()
+    pool.join()
+
+
+def percentile_panel(series, labels, ylabel, margin=0.5):
+  return {'ylabel' : ylabel,
+          'ymax' : margin + 1.1 * max(series[0] or [0]),
+          # negative latencies point at skewed clocks, keep them visible
+          'ymin' : min([0] + [min(y) for y in series if y]),
+          'legend' : True,
+          'series' : [(l, None, y) for l, y in zip(labels, series)]}
+
+
+def figure_specs(stats, path):
+  t = stats.times()
+  xmax = max(t) + stats.bin_size / 2.0
+  player_count = stats.player_count()
+  bitrates = stats.bitrates()
+  median, perc95 = bucket_percentiles(stats.rebuf_ratio, (0.5, 0.95))
+
+  players_panel = {'ylabel' : 'Number of players',
+                   'ymax' : 1.1 * max(player_count) or 1,
+                   'series' : [('Players', t, player_count)]}
+  bitrate_panel = {'ylabel' : 'Average bitrate (Kbps)',
+                   'ymax' : 100 + 1.1 * max(bitrates),
+                   'series' : [('Bitrate', t, bitrates)]}
+  rebuf_panel = percentile_panel([perc95, median], ['Perc95', 'Median'],
+                                 'Rebuffering ratio (%)')
+
+  specs = [{'fname' : 'num_player.png', 'title' : 'Number of active players',
+            'panels' : [players_panel]},
+           {'fname' : 'avg_bitrate.png', 'title' : 'Average bitrate',
+            'panels' : [dict(bitrate_panel,
+                             ylabel='Average video bitrate (Kbps)')]},
+           {'fname' : 'rebuf_ratio.png',
+            'title' : 'Rebuffering ratio (%) {median, perc95}',
+            'panels' : [rebuf_panel]},
+           {'fname' : 'summary.png', 'title' : '',
+            'panels' : [players_panel, bitrate_panel, rebuf_panel]}]
+
+  # live streams only
+  for buckets, fname, title, ylabel in (
+        (stats.latency, 'latency.png',
+         'Glass-to-glass latency (s) {median, perc95, perc99}', 'Latency (s)'),
+        (stats.live_edge, 'live_edge.png',
+         'Distance from live edge (s) {median, perc95, perc99}',
+         'Distance from live edge (s)')):
+    if not any(buckets):
+      continue
+    median, perc95, perc99 = bucket_percentiles(buckets, (0.5, 0.95, 0.99))
+    specs.append({'fname' : fname, 'title' : title,
+                  'panels' : [percentile_panel([perc99, perc95, median],
+                                               ['Perc99', 'Perc95', 'Median'],
+                                               ylabel)]})
+
+  if any(e != 'default' for e in stats.edges):
+    # Edges side by side: perc95 download time and errors over time
+    times = []
+    errors = []
+    for edge in sorted(stats.edges):
+      e = stats.edges[edge]
+      times.append((edge, t, bucket_percentiles(e.download_times, (0.95,))[0]))
+      errors.append((edge, t, e.errors_t))
+    specs.append({'fname' : 'edges.png',
+                  'title' : 'Per edge download time and errors',
+                  'panels' : [{'ylabel' : 'Download time perc95 (ms)',
+                               'ymax' : 1.1 * max(max(y) for l, t_, y in times) or 1,
+                               'legend' : True, 'linewidth' : 2.0,
+                               'series' : times},
+                              {'ylabel' : 'Failed downloads',
+                               'ymax' : 1.1 * max(max(y) for l, t_, y in errors) or 1,
+                               'linewidth' : 2.0,
+                               'series' : errors}]})
+
+  for spec in specs:
+    spec['path'] = os.path.join(path, spec['fname'])
+    spec['xmax'] = xmax
+    for panel in spec['panels']:
+      panel['series'] = [(l, t, y) for l, t_, y in panel['series']]
+  return specs
+
+
+def write_stream_stats(stats, path):
+  # Per stream summary of a catalog run, most watched streams first
+  if len(stats.streams) < 2:
+    return
+  f = open(os.path.join(path, 'streams.txt'), 'w')
+  f.write('stream,players,requests,errors,seg_download_median,'
+          'seg_download_perc95,rebuf_ratio_median,rebuf_ratio_perc95\n')
+  for stream in sorted(stats.streams, key=lambda k: -stats.streams[k].players):
+    s = stats.streams[stream]
+    seg_median, seg_perc95 = s.seg_times.percentiles((0.5, 0.95))
+    rebuf_median, rebuf_perc95 = s.rebuf.percentiles((0.5, 0.95))
+    f.write('%d,%d,%d,%d,%f,%f,%f,%f\n' % (stream, s.players, s.requests,
+                                          s.errors, seg_median, seg_perc95,
+                                          rebuf_median, rebuf_perc95))
+  f.close()
+
+
+def write_edge_stats(stats, path):
+  f = open(os.path.join(path, 'edges.txt'), 'w')
+  f.write('edge,requests,errors,error_rate,download_median,download_perc95\n')
+  for edge in sorted(stats.edges):
+    e = stats.edges[edge]
+    median, perc95 = e.download_time.percentiles((0.5, 0.95))
+    f.write('%s,%d,%d,%f,%f,%f\n' % (edge, e.requests, e.errors,
+                                     100.0 * e.errors / max(1, e.requests),
+                                     median, perc95))
+  f.close()
+
+
+def write_report(stats, specs, path):
+  # Single self-contained summary, figures are embedded
+  rebuf_median, rebuf_perc95 = stats.final_rebuf.percentiles((0.5, 0.95))
+  seg_median, seg_perc95 = stats.seg_time.percentiles((0.5, 0.95))
+  saturated = selfprofile.read_saturated(path)
+  rows = [('Start time', str(stats.start_time)),
+          ('Load generator saturated', {None : 'not profiled', True : 'YES',
+                                        False : 'no'}[saturated]),
+          ('Duration (s)', '%.1f' % stats.duration),
+          ('Bin size (s)', '%d' % stats.bin_size),
+          ('Players', '%d' % stats.players),
+          ('Max concurrent players', '%d' % max(stats.player_count())),
+          ('Requests', '%d' % stats.requests),
+          ('Failed downloads', '%d (%.2f%%)' % (stats.errors, 100.0 *
+                                              stats.errors /
+                                              max(1, stats.requests))),
+          ('Segment download median / perc95 (ms)', '%.1f / %.1f' % (
+                                                    seg_median, seg_perc95)),
+          ('Rebuffering ratio median / perc95 (%)', '%.2f / %.2f' % (
+                                                  rebuf_median, rebuf_perc95))]
+  f = open(os.path.join(path, 'report.html'), 'w')
+  f.write('<html><head><title>%s</title></head><body>\n' %
+          os.path.basename(os.path.normpath(path)))
+  f.write('<h1>%s</h1>\n' % os.path.basename(os.path.normpath(path)))
+  if saturated:
+    f.write('<p><b>The load generator was saturated, these results do not '
+            'describe the origin.</b></p>\n')
+  f.write('<table>\n')
+  for k, v in rows:
+    f.write('<tr><td>%s</td><td>%s</td></tr>\n' % (k, v))
+  f.write('</table>\n')
+  for fname in (selfprofile.PROFILE_FILE, 'capacity.txt', 'edges.txt',
+                'streams.txt'):
+    fpath = os.path.join(path, fname)
+    if os.path.exists(fpath):
+      fin = open(fpath, 'r')
+      # streams can be a very long list, only the head is embedded
+      lines = [fin.readline() for i in range(50)]
+      fin.close()
+      # frame names such as <module> and URLs with & are not markup
+      f.write('<h2>%s</h2>\n<pre>%s</pre>\n' % (fname,
+                                                cgi.escape(''.join(lines))))
+  for spec in specs:
+    fin = open(spec['path'], 'rb')
+    f.write('<h2>%s</h2>\n<img src="data:image/png;base64,%s"/>\n' % (
+            spec['fname'], base64.b64encode(fin.read())))
+    fin.close()
+  f.write('</body></html>\n')
+  f.close()
 
+
+def plot_results(path):
+  stats = parse_all_files(path)
+  if stats is None:
+    print 'No player logs in %s, nothing to plot' % path
+    return
+  write_stream_stats(stats, path)
+  if any(e != 'default' for e in stats.edges):
+    write_edge_stats(stats, path)
+  specs = figure_specs(stats, path)
+  render_all(specs)
+  write_report(stats, specs, path)
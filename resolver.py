@@ -0,0 +1,139 @@
+import socket
+import time
+import thread
+import itertools
+import functools
+import httplib
+import urllib2
+from threading import Lock, local
+
+
+DNS_CACHE_TTL = 60
+
+ROUND_ROBIN = 'rr'   # next address on every connection
+PIN = 'pin'          # each player sticks to one address
+
+
+def parse_override(spec):
+  # HOST=ADDR[,ADDR...][/pin] -> host, [addresses], mode
+  host, addrs = spec.split('=', 1)
+  mode = ROUND_ROBIN
+  if addrs.endswith('/' + PIN):
+    addrs = addrs[:-len(PIN) - 1]
+    mode = PIN
+  addrs = [a.strip() for a in addrs.split(',') if a.strip()]
+  if not host.strip() or not addrs:
+    raise ValueError('Bad resolver override: %s' % spec)
+  return host.strip().lower(), addrs, mode
+
+
+class Resolver(object):
+  # Maps host names to edge addresses while the original host is kept in
+  # the Host header and SNI. Overridden hosts are resolved once up front,
+  # other hosts are cached for DNS_CACHE_TTL seconds.
+  def __init__(self, overrides=None):
+    self._lock = Lock()
+    self._local = local()
+    self._overrides = {}
+    self._cache = {}
+    self._pinned = {}   # (pin key, host) -> address
+    for spec in overrides or []:
+      host, addrs, mode = parse_override(spec)
+      ips = [socket.gethostbyname(a) for a in addrs]
+      self._overrides[host] = (itertools.cycle(ips), mode)
+    self._opener = urllib2.build_opener(
+                    EdgeHTTPHandler(self),
+                    EdgeHTTPSHandler(self))
+
+  def address(self, host, pin_key=None):
+    # pin_key identifies the player, the calling thread when it is None
+    host = host.lower()
+    if host in self._overrides:
+      ips, mode = self._overrides[host]
+      with self._lock:
+        if mode != PIN:
+          return next(ips)
+        if pin_key is None:
+          pin_key = thread.get_ident()
+        key = (pin_key, host)
+        if key not in self._pinned:
+          self._pinned[key] = next(ips)
+        return self._pinned[key]
+
+    ip, expires = self._cache.get(host, (None, 0))
+    if expires < time.time():
+      ip = socket.gethostbyname(host)
+      with self._lock:
+        self._cache[host] = (ip, time.time() + DNS_CACHE_TTL)
+    return ip
+
+  def connect(self, host, port, timeout, source_address):
+    self._local.edge = self.address(host, getattr(self._local, 'pin_key',
+                                                  None))
+    return socket.create_connection((self._local.edge, port), timeout,
+                                    source_address)
+
+  def last_edge(self):
+    # address used by the last connection of the calling thread
+    return getattr(self._local, 'edge', '')
+
+  def urlopen(self, url, timeout, pin_key=None):
+    self._local.edge = ''
+    self._local.pin_key = pin_key
+    return self._opener.open(url, timeout=timeout)
+
+  def unpin(self, pin_key):
+    # forgets the addresses of a player that is done
+    with self._lock:
+      for key in [k for k in self._pinned if k[0] == pin_key]:
+        del self._pinned[key]
+
+
+class EdgeHTTPConnection(httplib.HTTPConnection):
+  def __init__(self, host, resolver=None, **kwargs):
+    httplib.HTTPConnection.__init__(self, host, **kwargs)
+    self._resolver = resolver
+
+  def connect(self):
+    self.sock = self._resolver.connect(self.host, self.port, self.timeout,
+                                       self.source_address)
+    if self._tunnel_host:
+      self._tunnel()
+
+
+class EdgeHTTPSConnection(httplib.HTTPSConnection):
+  def __init__(self, host, resolver=None, **kwargs):
+    httplib.HTTPSConnection.__init__(self, host, **kwargs)
+    self._resolver = resolver
+
+  def connect(self):
+    sock = self._resolver.connect(self.host, self.port, self.timeout,
+                                  self.source_address)
+    server_hostname = self.host
+    if self._tunnel_host:
+      self.sock = sock
+      self._tunnel()
+      server_hostname = self._tunnel_host
+    self.sock = self._context.wrap_socket(sock,
+                                          server_hostname=server_hostname)
+
+
+class EdgeHTTPHandler(urllib2.HTTPHandler):
+  def __init__(self, resolver):
+    urllib2.HTTPHandler.__init__(self)
+    self._resolver = resolver
+
+  def http_open(self, req):
+    return self.do_open(functools.partial(EdgeHTTPConnection,
+                                          resolver=self._resolver), req)
+
+
+class EdgeHTTPSHandler(urllib2.HTTPSHandler):
+  def __init__(self, resolver):
+    urllib2.HTTPSHandler.__init__(self)
+    self._resolver = resolver
+
+  def https_open(self, req):
+    return self.do_open(functools.partial(EdgeHTTPSConnection,
+                                          resolver=self._resolver), req,
+                        context=self._context)
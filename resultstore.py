@@ -0,0 +1,227 @@
+import os, sys
+import glob
+import sqlite3
+import argparse
+
+import plotresults
+import selfprofile
+
+
+RESULTS_DB = 'results.db'
+BUCKET_SIZE = 1  # seconds
+
+TYPES = {'manifest' : plotresults.MANIFEST_TYPE,
+         'seg' : plotresults.SEGMENT_TYPE}
+
+COLUMNS = ['download_time', 'content_length', 'buffer', 'rebuf_ratio',
+           'latency', 'live_edge']
+
+SCHEMA = [
+  '''CREATE TABLE IF NOT EXISTS experiments (
+       name TEXT PRIMARY KEY,
+       path TEXT,
+       start_time TEXT,
+       players INTEGER,
+       requests INTEGER,
+       saturated INTEGER)''',
+  '''CREATE TABLE IF NOT EXISTS requests (
+       exp TEXT,
+       bucket INTEGER,
+       time REAL,
+       player INTEGER,
+       type INTEGER,
+       stream INTEGER,
+       edge TEXT,
+       url TEXT,
+       content_length INTEGER,
+       download_time REAL,
+       buffer REAL,
+       rebuf_ratio REAL,
+       error_count INTEGER,
+       latency REAL,
+       live_edge REAL)''',
+  'CREATE INDEX IF NOT EXISTS idx_bucket ON requests (exp, bucket, type)',
+  'CREATE INDEX IF NOT EXISTS idx_player ON requests (exp, player, time)',
+  'CREATE INDEX IF NOT EXISTS idx_url ON requests (exp, url)',
+]
+
+
+def connect(db_path):
+  db = sqlite3.connect(db_path)
+  for stmt in SCHEMA:
+    db.execute(stmt)
+  # databases created before the load generator was profiled
+  columns = [r[1] for r in db.execute('PRAGMA table_info(experiments)')]
+  if 'saturated' not in columns:
+    db.execute('ALTER TABLE experiments ADD COLUMN saturated INTEGER')
+  return db
+
+
+def ingest(db_path, exp_dir, name=None, force=False):
+  # Loads the player logs of an experiment once, returns the number of rows
+  if name is None:
+    name = os.path.basename(os.path.normpath(exp_dir))
+  db = connect(db_path)
+  exists = db.execute('SELECT 1 FROM experiments WHERE name=?',
+                      (name,)).fetchone()
+  if exists and not force:
+    db.close()
+    return 0
+
+  files = glob.glob(os.path.join(exp_dir, '*.csv'))
+  start_time, end_time = plotresults.scan_files(files)
+  if start_time is None:
+    # no player logged anything, leave the name free for a later ingest
+    db.close()
+    return 0
+  if exists:
+    db.execute('DELETE FROM requests WHERE exp=?', (name,))
+    db.execute('DELETE FROM experiments WHERE name=?', (name,))
+
+  players = 0
+  rows = 0
+  for f in files:
+    p = plotresults.PlayerStats(f)
+    p.parse()
+    if not p.get_time():
+      continue
+    p.update_relative_time(start_time)
+    players += 1
+    rows += len(p.get_time())
+    db.executemany('INSERT INTO requests VALUES '
+                   '(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)',
+                   ((name, int(t / BUCKET_SIZE), t, p.player_id, ftype,
+                     p.stream, edge, url, clen, dtime, buf, rebuf, errors,
+                     latency, live_edge)
+                    for t, ftype, edge, url, clen, dtime, buf, rebuf, errors,
+                        latency, live_edge in zip(p.get_time(),
+                                                  p.get_type(),
+                                                  p.get_edge(),
+                                                  p.get_url(),
+                                                  p.get_content_length(),
+                                                  p.get_download_time(),
+                                                  p.get_buffer(),
+                                                  p.get_rebuf_ratio(),
+                                                  p.get_error_count(),
+                                                  p.get_latency(),
+                                                  p.get_live_edge())))
+  # NULL when the load generator was not profiled
+  db.execute('INSERT INTO experiments (name, path, start_time, players, '
+             'requests, saturated) VALUES (?,?,?,?,?,?)',
+             (name, os.path.abspath(exp_dir), str(start_time), players, rows,
+              selfprofile.read_saturated(exp_dir)))
+  db.commit()
+  db.close()
+  return rows
+
+
+def percentiles(vals, percs):
+  vals = sorted(vals)
+  if not vals:
+    return [0.0] * len(percs)
+  return [vals[min(int(p * len(vals)), len(vals) - 1)] for p in percs]
+
+
+def window_values(db, exp, start, end, column='download_time', req_type=None):
+  if column not in COLUMNS:
+    raise ValueError('Unknown column %s' % column)
+  query = ('SELECT %s FROM requests WHERE exp=? AND bucket BETWEEN ? AND ? '
+           'AND time >= ? AND time < ?' % column)
+  params = [exp, int(start / BUCKET_SIZE), int(end / BUCKET_SIZE), start, end]
+  if req_type is not None:
+    query += ' AND type=?'
+    params.append(TYPES[req_type])
+  if column == 'latency':
+    query += ' AND latency IS NOT NULL'  # NULL when not measured
+  elif column == 'live_edge':
+    query += ' AND live_edge >= 0'  # -1 when not measured
+  return [r[0] for r in db.execute(query, params)]
+
+
+def window_percentiles(db, exp, start, end, column='download_time',
+                       req_type=None, percs=(0.5, 0.95, 0.99)):
+  return percentiles(window_values(db, exp, start, end, column, req_type),
+                     percs)
+
+
+def player_timeline(db, exp, player):
+  return db.execute('SELECT time, type, download_time, buffer, rebuf_ratio, '
+                    'error_count, url FROM requests WHERE exp=? AND player=? '
+                    'ORDER BY time', (exp, player)).fetchall()
+
+
+def is_saturated(db, exp):
+  row = db.execute('SELECT saturated FROM experiments WHERE name=?',
+                   (exp,)).fetchone()
+  return bool(row and row[0])
+
+
+def compare(db, exps, start, end, column='download_time', req_type=None,
+            percs=(0.5, 0.95, 0.99)):
+  return [(exp, window_percentiles(db, exp, start, end, column, req_type,
+                                   percs)) for exp in exps]
+
+
+def parse_params():
+  parser = argparse.ArgumentParser(description='Indexed store of hlsplayer '
+                                   'experiment results')
+  parser.add_argument('--db', dest='db', default=RESULTS_DB, type=str,
+                      help='path of the results database')
+  sub = parser.add_subparsers(dest='cmd')
+
+  p = sub.add_parser('ingest', help='load experiment directories')
+  p.add_argument('exp_dirs', nargs='+')
+  p.add_argument('--force', action='store_true',
+                 help='reload experiments that were already ingested')
+
+  for cmd, helptext in (('window', 'percentiles over a time window'),
+                        ('compare', 'percentiles of several experiments')):
+    p = sub.add_parser(cmd, help=helptext)
+    p.add_argument('exps', nargs=1 if cmd == 'window' else '+')
+    p.add_argument('--start', type=float, default=0.0,
+                   help='window start (s since experiment start)')
+    p.add_argument('--end', type=float, default=float('inf'),
+                   help='window end (s since experiment start)')
+    p.add_argument('--column', default='download_time', choices=COLUMNS)
+    p.add_argument('--type', dest='req_type', default=None,
+                   choices=sorted(TYPES))
+    p.add_argument('--reject-saturated', dest='reject_saturated',
+                   action='store_true',
+                   help='skip experiments whose load generator was saturated')
+
+  p = sub.add_parser('timeline', help='requests of one player')
+  p.add_argument('exp')
+  p.add_argument('player', type=int)
+  return parser
+
+
+def main(argv):
+  args = parse_params().parse_args(argv[1:])
+  if args.cmd == 'ingest':
+    for d in args.exp_dirs:
+      print '%s: %d rows' % (d, ingest(args.db, d, force=args.force))
+    return 0
+
+  db = connect(args.db)
+  if args.cmd in ('window', 'compare'):
+    # sqlite cannot bind inf
+    end = min(args.end, sys.maxint)
+    exps = args.exps
+    if args.reject_saturated:
+      for exp in [e for e in exps if is_saturated(db, e)]:
+        print >> sys.stderr, '%s: load generator saturated, skipped' % exp
+      exps = [e for e in exps if not is_saturated(db, e)]
+    print 'exp,median,perc95,perc99'
+    for exp, vals in compare(db, exps, args.start, end, args.column,
+                             args.req_type):
+      print '%s,%f,%f,%f' % tuple([exp] + vals)
+  elif args.cmd == 'timeline':
+    print 'time,type,download_time,buffer,rebuf_ratio,error_count,url'
+    for row in player_timeline(db, args.exp, args.player):
+      print '%f,%d,%f,%f,%f,%d,%s' % row
+  db.close()
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))
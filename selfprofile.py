@@ -0,0 +1,262 @@
+import os, sys
+import time
+import random
+import logging
+import linecache
+import functools
+from threading import Thread, Lock
+
+
+SAMPLE_INTERVAL = 0.1     # stack samples and lag probe (s)
+REPORT_INTERVAL = 5.0     # saturation check interval (s)
+MAX_SAMPLED_THREADS = 50  # threads whose stacks are sampled per tick
+PROFILE_TOP = 30
+MAX_STACK_DEPTH = 40
+
+# leaf frames of threads that wait rather than work; time.sleep is a C
+# function and leaves no frame of its own, its caller's line is checked.
+# socket.py:meth forwards connect, recv, sendall, ... to the C socket.
+IDLE_FRAMES = set([('threading.py', 'wait'), ('Queue.py', 'get'),
+                   ('socket.py', 'meth'),
+                   ('socket.py', 'read'), ('socket.py', 'readline'),
+                   ('socket.py', 'create_connection'), ('ssl.py', 'read'),
+                   ('ssl.py', 'recv'), ('ssl.py', 'do_handshake')])
+
+SELF_PATH = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+REPO_DIR = os.path.dirname(SELF_PATH)
+
+# A CPython process cannot use much more than one core because of the GIL
+CPU_SATURATION = 0.9      # cores
+LAG_SATURATION = 0.5      # perc95 scheduling lag (s)
+SATURATED_SHARE = 0.05    # share of saturated intervals that flags the run
+
+PROFILE_FILE = 'generator.txt'
+
+# the running Monitor, None when self-profiling is off
+monitor = None
+
+
+def timed(name):
+  # Adds the wall time of the decorated function to the monitor's timer
+  def wrap(f):
+    @functools.wraps(f)
+    def inner(*args, **kwargs):
+      if monitor is None:
+        return f(*args, **kwargs)
+      ts = time.time()
+      try:
+        return f(*args, **kwargs)
+      finally:
+        monitor.add_time(name, time.time() - ts)
+    return inner
+  return wrap
+
+
+def record_lag(lag):
+  if monitor is not None:
+    monitor.add_lag(lag)
+
+
+def sleep(seconds):
+  # time.sleep that records how late the caller was woken up
+  ts = time.time()
+  time.sleep(seconds)
+  record_lag(time.time() - ts - seconds)
+
+
+def saturated_since(ts):
+  return monitor is not None and monitor.saturated_since(ts)
+
+
+class Monitor(Thread):
+  def __init__(self):
+    Thread.__init__(self)
+    self.daemon = True
+    self._lock = Lock()
+    self._stop = False
+    self._timers = {}     # name -> [calls, total seconds]
+    self._lags = []       # lags of the current interval
+    self._samples = {}    # first repo frame (file:function:line) -> count
+    self._stacks = {}     # file:function;... outermost first -> count
+    self._idle = {}       # idle leaf frame (file:function:line) -> count
+    self._sample_count = 0
+    self.intervals = []   # (time, cpu, lag_p95, lag_max, threads, saturated)
+
+  def add_time(self, name, seconds):
+    with self._lock:
+      t = self._timers.get(name)
+      if t is None:
+        t = self._timers[name] = [0, 0.0]
+      t[0] += 1
+      t[1] += seconds
+
+  def add_lag(self, lag):
+    with self._lock:
+      self._lags.append(max(lag, 0.0))
+
+  def sample_stacks(self):
+    # wall clock samples: where the other threads are right now
+    frames = sys._current_frames()
+    me = self.ident
+    idents = [i for i in frames if i != me]
+    if len(idents) > MAX_SAMPLED_THREADS:
+      idents = random.sample(idents, MAX_SAMPLED_THREADS)
+    for i in idents:
+      self.add_sample(frames[i])
+      self._sample_count += 1
+
+  def add_sample(self, leaf):
+    if is_idle(leaf):
+      key = frame_location(leaf)
+      self._idle[key] = self._idle.get(key, 0) + 1
+      return
+    stack = []
+    location = None
+    f = leaf
+    while f is not None and len(stack) < MAX_STACK_DEPTH:
+      stack.append('%s:%s' % (os.path.basename(f.f_code.co_filename),
+                              f.f_code.co_name))
+      if location is None and is_repo_code(f):
+        location = frame_location(f)
+      f = f.f_back
+    location = location or frame_location(leaf)
+    self._samples[location] = self._samples.get(location, 0) + 1
+    key = ';'.join(reversed(stack))
+    self._stacks[key] = self._stacks.get(key, 0) + 1
+
+  def close_interval(self, ts, cpu):
+    with self._lock:
+      lags = sorted(self._lags)
+      self._lags = []
+    lag_p95 = lags[min(int(0.95 * len(lags)), len(lags) - 1)] if lags else 0.0
+    lag_max = lags[-1] if lags else 0.0
+    saturated = cpu > CPU_SATURATION or lag_p95 > LAG_SATURATION
+    self.intervals.append((ts, cpu, lag_p95, lag_max,
+                           len(sys._current_frames()), saturated))
+    if saturated:
+      logging.warning('Load generator saturated: cpu %.2f cores, '
+                      'scheduling lag perc95 %.3f s' % (cpu, lag_p95))
+
+  def run(self):
+    self._last_ts = time.time()
+    self._last_cpu = sum(os.times()[:2])
+    while not self._stop:
+      # the monitor is its own lag probe
+      sleep_start = time.time()
+      time.sleep(SAMPLE_INTERVAL)
+      self.add_lag(time.time() - sleep_start - SAMPLE_INTERVAL)
+      self.sample_stacks()
+      if time.time() - self._last_ts >= REPORT_INTERVAL:
+        self.next_interval()
+
+  def next_interval(self):
+    ts = time.time()
+    cpu = sum(os.times()[:2])
+    self.close_interval(ts, (cpu - self._last_cpu) / (ts - self._last_ts))
+    self._last_ts = ts
+    self._last_cpu = cpu
+
+  def stop(self):
+    self._stop = True
+    self.join()
+    # whatever is left of the last interval, unless it is too short for its
+    # cpu rate to mean anything next to the full intervals it is counted with
+    if time.time() - self._last_ts >= REPORT_INTERVAL / 2:
+      self.next_interval()
+
+  def saturated_since(self, ts):
+    return any(i[5] for i in self.intervals if i[0] >= ts)
+
+  def saturated(self):
+    if not self.intervals:
+      return False
+    count = len([i for i in self.intervals if i[5]])
+    return count > SATURATED_SHARE * len(self.intervals)
+
+  def write(self, dst_dir):
+    intervals = self.intervals
+    saturated = len([i for i in intervals if i[5]])
+    cpu = [i[1] for i in intervals] or [0.0]
+    lag_p95 = [i[2] for i in intervals] or [0.0]
+    lag_max = [i[3] for i in intervals] or [0.0]
+    f = open(os.path.join(dst_dir, PROFILE_FILE), 'w')
+    # first line is read by plotresults and resultstore
+    f.write('saturated: %s\n' % ('yes' if self.saturated() else 'no'))
+    f.write('saturated intervals: %d of %d\n' % (saturated, len(intervals)))
+    f.write('cpu (cores) mean/max: %.2f / %.2f\n' % (sum(cpu) / len(cpu),
+                                                     max(cpu)))
+    f.write('scheduling lag perc95/max (s): %.3f / %.3f\n' % (max(lag_p95),
+                                                             max(lag_max)))
+    f.write('\ntimer,calls,total_s,mean_ms\n')
+    for name in sorted(self._timers):
+      calls, total = self._timers[name]
+      f.write('%s,%d,%f,%f\n' % (name, calls, total,
+                                 1000.0 * total / max(1, calls)))
+    total = float(max(1, self._sample_count))
+    f.write('\nidle share of sampled threads: %.3f\n'
+            % (sum(self._idle.values()) / total))
+    for title, counts in (
+        ('share,location (first repo frame of busy threads, wall clock)',
+         self._samples),
+        ('share,stack (busy threads, outermost frame first)', self._stacks),
+        ('share,location (idle threads)', self._idle)):
+      f.write('\n%s\n' % title)
+      top = sorted(counts.items(), key=lambda kv: -kv[1])[:PROFILE_TOP]
+      for key, count in top:
+        f.write('%.3f,%s\n' % (count / total, key))
+    f.write('\ntime,cpu,lag_p95,lag_max,threads,saturated\n')
+    for ts, c, p95, lmax, threads, sat in intervals:
+      f.write('%f,%f,%f,%f,%d,%d\n' % (ts, c, p95, lmax, threads, sat))
+    f.close()
+
+
+def frame_location(f):
+  return '%s:%s:%d' % (os.path.basename(f.f_code.co_filename),
+                       f.f_code.co_name, f.f_lineno)
+
+
+def is_repo_code(f):
+  path = os.path.abspath(f.f_code.co_filename)
+  return os.path.dirname(path) == REPO_DIR and path != SELF_PATH
+
+
+def is_idle(f):
+  name = (os.path.basename(f.f_code.co_filename), f.f_code.co_name)
+  if name in IDLE_FRAMES:
+    return True
+  line = linecache.getline(f.f_code.co_filename, f.f_lineno)
+  return 'sleep(' in line
+
+
+def start():
+  global monitor
+  monitor = Monitor()
+  monitor.start()
+  return monitor
+
+
+def stop(dst_dir):
+  # Writes the self-profile to dst_dir, returns True if the generator was
+  # saturated for a significant part of the run
+  global monitor
+  if monitor is None:
+    return False
+  m = monitor
+  monitor = None
+  m.stop()
+  m.write(dst_dir)
+  if m.saturated():
+    logging.warning('Load generator was saturated, results in %s reflect '
+                    'the generator rather than the origin' % dst_dir)
+  return m.saturated()
+
+
+def read_saturated(exp_dir):
+  # None when the experiment was not profiled
+  fpath = os.path.join(exp_dir, PROFILE_FILE)
+  if not os.path.exists(fpath):
+    return None
+  f = open(fpath, 'r')
+  l = f.readline().strip()
+  f.close()
+  return l == 'saturated: yes'
@@ -0,0 +1,261 @@
+import os, sys
+import re
+import heapq
+import tempfile
+import urlparse
+
+
+# A session is closed once its client has been idle for this long
+SESSION_IDLE_TIMEOUT = 60.0
+# How often (in access log lines) idle sessions are flushed
+SWEEP_INTERVAL = 10000
+# Number of sessions sorted in memory at once when building a schedule
+SCHEDULE_CHUNK = 10000
+
+# Session events
+MASTER = 'p'         # arg: master playlist path
+JOIN = 'join'        # arg: variant playlist path
+SEGMENT = 's'        # download next segment
+MANIFEST = 'm'       # refresh variant playlist
+SEEK = 'k'           # arg: jump (in segments) relative to the next segment
+STOP = 'x'
+
+# sequence number: trailing digits of the file name without its extension
+SEQ_RE = re.compile(r'(\d+)$')
+
+
+# Trace format, one line per session:
+#   session_id,join_time,session_len,events
+# join_time is in epoch seconds and events is a space separated list of
+# gap_ms:op[:arg] where gap_ms is the time since the previous event (or the
+# join_time). Events start with the master playlist request, if any, and
+# the join to the variant playlist.
+#
+# Schedule format, one line per event, sorted by time:
+#   time,session_id,op,arg
+# time is in seconds since the first join of the trace.
+
+
+def segment_sequence(path):
+  # seg_42.m4s -> 42, /1080p/segment.ts -> None
+  stem = os.path.splitext(os.path.basename(path))[0]
+  m = SEQ_RE.search(stem)
+  if m:
+    return int(m.group(1))
+  return None
+
+
+def gap_ms(seconds):
+  return int(round(1000 * seconds))
+
+
+class Session(object):
+  def __init__(self, session_id, ts):
+    self.session_id = session_id
+    self.join_time = ts
+    self.last_time = ts
+    self.last_event_time = ts
+    self.first_playlist = None   # (time, path)
+    self.variant = None
+    self.variant_time = None
+    self.started = False
+    self.last_seq = None
+    self.events = []
+
+  def add_request(self, ts, url):
+    parts = urlparse.urlsplit(url)
+    path = parts.path
+    if parts.query:
+      path = '%s?%s' % (path, parts.query)
+    self.last_time = ts
+
+    if parts.path.endswith('.m3u8'):
+      if not self.started:
+        # still joining, the last playlist before the first segment is
+        # the variant the viewer picked, an earlier one its master
+        if self.first_playlist is None:
+          self.first_playlist = (ts, path)
+        self.variant = path
+        self.variant_time = ts
+        self.last_event_time = ts
+      else:
+        self.events.append((self.gap(ts), MANIFEST, ''))
+      return
+
+    if self.variant is None:
+      return
+    self.started = True
+    gap = self.gap(ts)
+    seq = segment_sequence(parts.path)
+    # seeks are only detected between two numbered segments; the same number
+    # twice is a retry or a name that does not carry a sequence number
+    if seq is not None and self.last_seq is not None and \
+       seq not in (self.last_seq, self.last_seq + 1):
+      self.events.append((gap, SEEK, str(seq - self.last_seq - 1)))
+      gap = 0
+    self.last_seq = seq
+    self.events.append((gap, SEGMENT, ''))
+
+  def gap(self, ts):
+    # ms since the previous event (or the join)
+    gap = gap_ms(ts - self.last_event_time)
+    self.last_event_time = ts
+    return gap
+
+  def join_events(self):
+    ts, path = self.first_playlist
+    if path == self.variant:
+      return [(gap_ms(self.variant_time - self.join_time), JOIN, self.variant)]
+    return [(gap_ms(ts - self.join_time), MASTER, path),
+            (gap_ms(self.variant_time - ts), JOIN, self.variant)]
+
+  def to_line(self):
+    events = ['%d:%s%s' % (gap, op, ':' + arg if arg else '')
+              for gap, op, arg in self.join_events() + self.events]
+    events.append('0:%s' % STOP)
+    return '%s,%f,%f,%s' % (self.session_id, self.join_time,
+                            self.last_time - self.join_time, ' '.join(events))
+
+
+def record_access_log(log_path, trace_path):
+  # Build session traces from an access log with lines time,client_id,url
+  # (time in epoch seconds, lines sorted by time). Only open sessions are
+  # kept in memory.
+  sessions = {}
+  session_count = 0
+  fin = open(log_path, 'r')
+  fout = open(trace_path, 'w')
+
+  def flush(client, s):
+    del sessions[client]
+    if s.variant is not None:
+      fout.write('%s\n' % s.to_line())
+
+  for idx, l in enumerate(fin):
+    parts = l.strip().split(',')
+    if len(parts) < 3:
+      continue
+    try:
+      ts = float(parts[0])
+    except ValueError: # header or bad line
+      continue
+    client = parts[1]
+    s = sessions.get(client)
+    if s is not None and ts - s.last_time > SESSION_IDLE_TIMEOUT:
+      flush(client, s)
+      s = None
+    if s is None:
+      session_count += 1
+      s = Session(session_count, ts)
+      sessions[client] = s
+    s.add_request(ts, parts[2])
+
+    if idx % SWEEP_INTERVAL == 0:
+      for client, s in sessions.items():
+        if ts - s.last_time > SESSION_IDLE_TIMEOUT:
+          flush(client, s)
+
+  for client, s in sessions.items():
+    flush(client, s)
+  fin.close()
+  fout.close()
+
+
+def read_traces(trace_path):
+  f = open(trace_path, 'r')
+  for l in f:
+    parts = l.strip().split(',', 3)
+    if len(parts) != 4:
+      continue
+    session_id, join_time, session_len, events = parts
+    yield session_id, float(join_time), events.split()
+  f.close()
+
+
+def session_events(base_time, session_id, join_time, events):
+  t = join_time - base_time
+  for i, e in enumerate(events):
+    e = e.split(':', 2)
+    t += int(e[0]) / 1000.0
+    yield (t, session_id, i, e[1], e[2] if len(e) > 2 else '')
+
+
+def write_chunk(events, tmp_dir):
+  events.sort()
+  fd, path = tempfile.mkstemp(dir=tmp_dir, suffix='.sched')
+  f = os.fdopen(fd, 'w')
+  for e in events:
+    f.write('%f,%s,%d,%s,%s\n' % e)
+  f.close()
+  return path
+
+
+def read_chunk(path):
+  f = open(path, 'r')
+  for l in f:
+    t, session_id, idx, op, arg = l.rstrip('\n').split(',', 4)
+    yield (float(t), session_id, int(idx), op, arg)
+  f.close()
+
+
+def build_schedule(trace_path, schedule_path):
+  # External merge sort: sessions are expanded and sorted in chunks of
+  # SCHEDULE_CHUNK, then the sorted chunks are merged into the schedule.
+  base_time = None
+  for session_id, join_time, events in read_traces(trace_path):
+    if base_time is None or join_time < base_time:
+      base_time = join_time
+  if base_time is None:
+    open(schedule_path, 'w').close()
+    return
+
+  tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(schedule_path)))
+  chunks = []
+  events = []
+  sessions = 0
+  for trace in read_traces(trace_path):
+    events.extend(session_events(base_time, *trace))
+    sessions += 1
+    if sessions % SCHEDULE_CHUNK == 0:
+      chunks.append(write_chunk(events, tmp_dir))
+      events = []
+  if events:
+    chunks.append(write_chunk(events, tmp_dir))
+
+  fout = open(schedule_path, 'w')
+  for t, session_id, idx, op, arg in heapq.merge(*[read_chunk(c) for c in chunks]):
+    fout.write('%f,%s,%s,%s\n' % (t, session_id, op, arg))
+  fout.close()
+  for c in chunks:
+    os.remove(c)
+  os.rmdir(tmp_dir)
+
+
+def read_schedule(schedule_path):
+  f = open(schedule_path, 'r')
+  for l in f:
+    parts = l.rstrip('\n').split(',', 3)
+    if len(parts) != 4:
+      continue
+    try:
+      t = float(parts[0])
+    except ValueError: # header or bad line
+      continue
+    yield t, parts[1], parts[2], parts[3]
+  f.close()
+
+
+def main(argv):
+  if len(argv) != 4 or argv[1] not in ('record', 'schedule'):
+    print 'usage: %s record ACCESS_LOG TRACE_FILE' % argv[0]
+    print '       %s schedule TRACE_FILE SCHEDULE_FILE' % argv[0]
+    return 1
+  if argv[1] == 'record':
+    record_access_log(argv[2], argv[3])
+  else:
+    build_schedule(argv[2], argv[3])
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))